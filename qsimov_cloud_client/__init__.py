@@ -1,4 +1,4 @@
-from .client import QsimovCloudClient, SuperpositionCircuit, _services, _ancilla_modes, requests
+from .client import QsimovCloudClient, SuperpositionCircuit, _services, _ancilla_modes, urllib3
 
 
 __all__ = ["QsimovCloudClient", "SuperpositionCircuit"]
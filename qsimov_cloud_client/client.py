@@ -1,29 +1,105 @@
 # -*- coding: utf-8 -*-
+import gzip
 import json
 import logging
 import re
-import requests
-import sympy as sp
+import threading
+import urllib3
 
+from collections import OrderedDict
 from collections.abc import Iterable
-from requests.adapters import HTTPAdapter, Retry
+from concurrent.futures import ThreadPoolExecutor
+from fractions import Fraction
+from urllib3.exceptions import HTTPError
+from urllib3.util import Retry, Timeout
+
+from .utils import _INF, _NAN, parse_number
+
+
+def _json_default(value):
+    """Serialize the numbers returned by parse_number that JSON has no type for.
+
+    Args:
+        value: The value the JSON encoder could not serialize.
+
+    Returns:
+        str: The string representation of the number.
+
+    Raises:
+        TypeError: If the value is not a Fraction or NaN.
+    """
+    if isinstance(value, Fraction) or value is _NAN:
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON "
+                    "serializable")
+
+
+def _json_dumps(values):
+    return json.dumps(values, default=_json_default,
+                      separators=(",", ":")).encode("utf-8")
+
+
+try:
+    import orjson
+
+    def _dumps(values):
+        try:
+            return orjson.dumps(values, default=_json_default)
+        except orjson.JSONEncodeError:
+            # orjson only encodes integers up to 64 bits, e.g. not large states
+            return _json_dumps(values)
+    _loads = orjson.loads
+except ImportError:
+    orjson = None
+    _dumps = _json_dumps
+    _loads = json.loads
+
+
+_bin_regex = re.compile(r"[01]+")
+_services = frozenset({"extra_qubits_service",
+                       "distances_range_service",
+                       "circuit_service",
+                       "total_states_superposed_service"})
+_ancilla_modes = frozenset({'clean', 'noancilla', 'garbage', 'borrowed',
+                            'burnable'})
+_data_fields = ("token", "metric", "n_qubits", "state", "state_bin",
+                "distances", "distances_str", "min_range", "max_range",
+                "with_nan", "ancilla_mode", "qasm_version")
+_data_index = {field: i for i, field in enumerate(_data_fields)}
+_simple_fields = ("token", "metric", "state_bin", "state", "n_qubits",
+                  "ancilla_mode", "qasm_version")
+_circuit_like_fields = _simple_fields + ("with_nan", "distances_str",
+                                         "min_range", "max_range")
+_url = "https://qcaas.qsimov.com/superpositions"
+_timeout = Timeout(connect=10, read=900)
+_headers = {"Content-Type": "application/json",
+            "Accept-Encoding": "gzip, deflate"}
+_gzip_headers = {**_headers, "Content-Encoding": "gzip"}
+_gzip_threshold = 1024
+_cache_size = 32
+_logger = logging.getLogger("QsimovCloudClient")
 
-from .utils import parse_number
 
+def _is_bin(state_bin):
+    """Check whether a string is a non-empty sequence of bits.
 
-_bin_regex = re.compile(r"^[01]+$")
-_services = ["extra_qubits_service",
-             "distances_range_service",
-             "circuit_service",
-             "total_states_superposed_service"]
-_ancilla_modes = ['clean', 'noancilla', 'garbage', 'borrowed', 'burnable']
-_url = "https://qcaas.qsimov.com/superpositions"
-_logger = logging.getLogger("QsimovCloudClient")
+    Args:
+        state_bin (str): The string to be checked.
+
+    Returns:
+        bool: True if the string only contains '0' and '1' characters.
+    """
+    if 0 < len(state_bin) < 64:
+        return state_bin.count("0") + state_bin.count("1") == len(state_bin)
+    return _bin_regex.fullmatch(state_bin) is not None
 
 
 class QsimovCloudClient(object):
     """QsimovCloudClient is a Python client for interacting with the Qsimov cloud services."""
 
+    __slots__ = ("_data", "_http", "_cache", "_cache_lock", "_config_key",
+                 "_gzip_upload")
+
     def __init__(self, token):
         """
         Initialize the QsimovCloudClient with a valid access token.
@@ -43,16 +119,63 @@ class QsimovCloudClient(object):
         self._data["state"] = None
         self._data["state_bin"] = None
         self._data["distances"] = None
+        self._data["distances_str"] = None
         self._data["min_range"] = None
         self._data["max_range"] = None
         self._data["with_nan"] = None
         self._data["ancilla_mode"] = "clean"
         self._data["qasm_version"] = "2.0"
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._gzip_upload = True
+        self._config_key = tuple(self._data[field] for field in _data_fields)
+        # The services are deterministic, so retrying a POST is safe. Read
+        # errors are not retried, a timed out request already waited 900s
+        retries = Retry(total=5,
+                        read=False,
+                        backoff_factor=0.1,
+                        status_forcelist=[500, 502, 503, 504],
+                        allowed_methods=Retry.DEFAULT_ALLOWED_METHODS | {"POST"})
+        self._http = urllib3.PoolManager(num_pools=2, maxsize=10,
+                                         retries=retries)
+
+    def _set_data(self, field, value):
+        """
+        Set a configuration value and update its slot in the response cache key.
+
+        Args:
+            field (str): The name of the configuration field.
+            value: The new value of the field.
+        """
+        i = _data_index[field]
+        self._data[field] = value
+        self._config_key = self._config_key[:i] + (value,) + self._config_key[i + 1:]
+
+    def clear_cache(self):
+        """Discard every response stored by previous calls to the Qsimov cloud services.
+
+        One response is kept per service and distinct configuration, up to the 32 most recently used ones.
+        """
+        with self._cache_lock:
+            self._cache.clear()
+
+    def close(self):
+        """Close the underlying HTTP pool and release its connections."""
+        self._http.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
     def _send_request(self, service):
         """
         Send a request to the Qsimov cloud service.
 
+        Responses are cached per service and configuration, so repeating a call without changing any
+        parameter does not contact the service again. Only the 32 most recently used responses are kept.
+
         Args:
             service (str): The name of the Qsimov cloud service to be invoked.
 
@@ -70,10 +193,10 @@ class QsimovCloudClient(object):
                              "specified")
         if service not in _services:
             raise ValueError("unknown service")
-        values = self._data.copy()
-        if (service == "circuit_service"
-                or service == "total_states_superposed_service"
-                or service == "extra_qubits_service"):
+        needs_distances = (service == "circuit_service"
+                           or service == "total_states_superposed_service"
+                           or service == "extra_qubits_service")
+        if needs_distances:
             if self._data["with_nan"] is None:
                 raise ValueError("with_nan has to be set when using circuit, "
                                  "extra_qubits and total_states_superposed "
@@ -83,51 +206,84 @@ class QsimovCloudClient(object):
                 raise ValueError("either distances or min/max distance have "
                                  "to be set when using circuit, extra_qubits "
                                  "and total_states_superposed services")
-            if values["distances"] is None:
-                del values["distances"]
-                values["min_range"] = str(values["min_range"])
-                values["max_range"] = str(values["max_range"])
-            else:
-                del values["min_range"]
-                del values["max_range"]
-                values["distances"] = [str(i) for i in values["distances"]]
+        key = (service, self._config_key)
+        with self._cache_lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+        if needs_distances:
+            values = self._payload(service, _circuit_like_fields)
         else:
-            del values["with_nan"]
-            del values["distances"]
-            del values["min_range"]
-            del values["max_range"]
-        if values["state_bin"] is None:
-            del values["state_bin"]
-        else:
-            del values["state"]
-            del values["n_qubits"]
-        values["service"] = service
+            values = self._payload(service, _simple_fields)
         res = self._post(values)
-        return res.json()["response"]
+        response = _loads(res.data)["response"]
+        # Circuits given as a download URL are not cached since the URL may expire
+        if (service != "circuit_service"
+                or not response["qasm_circuit"].startswith("https")):
+            with self._cache_lock:
+                self._cache[key] = response
+                if len(self._cache) > _cache_size:
+                    self._cache.popitem(last=False)
+        return response
+
+    def _payload(self, service, fields):
+        """
+        Build the request payload from the configuration fields a service needs.
+
+        Args:
+            service (str): The name of the Qsimov cloud service to be invoked.
+            fields (tuple): The names of the configuration fields to be sent. Unset fields are skipped.
+
+        Returns:
+            dict: The data to be sent in the request.
+        """
+        data = self._data
+        values = {field: data[field] for field in fields
+                  if data[field] is not None}
+        values["service"] = service
+        if "distances_str" in values:
+            values["distances"] = values.pop("distances_str")
+        elif "min_range" in values:
+            # Infinity is a float, which JSON encoders write as null or Infinity.
+            # Fractions and NaN are left to _json_default.
+            if values["min_range"] is _INF:
+                values["min_range"] = "inf"
+            if values["max_range"] is _INF:
+                values["max_range"] = "inf"
+        return values
 
     def _post(self, values):
         """
         Perform a POST request to the Qsimov cloud service.
 
+        Bodies larger than 1 KiB are sent gzip-compressed. If the service answers 415 the request is
+        repeated uncompressed and compression is disabled for this client.
+
         Args:
             values (dict): The data to be sent in the request.
 
         Returns:
-            requests.Response: The response from the Qsimov cloud service.
+            urllib3.HTTPResponse: The response from the Qsimov cloud service.
 
         Raises:
-            requests.exceptions.HTTPError: If the request was unsuccessful.
+            urllib3.exceptions.HTTPError: If the request was unsuccessful.
         """
+        body = _dumps(values)
         res = None
-        with requests.Session() as s:
-            retries = Retry(total=5,
-                            backoff_factor=0.1,
-                            status_forcelist=[ 500, 502, 503, 504 ])
-            s.mount('https://', HTTPAdapter(max_retries=3))
-            res = s.post(_url, json=values, timeout=(10, 900))
-            if res.status_code // 100 != 2:
-                _logger.error(res.json())
-            res.raise_for_status()
+        if self._gzip_upload and len(body) > _gzip_threshold:
+            res = self._http.request("POST", _url, body=gzip.compress(body),
+                                     headers=_gzip_headers, timeout=_timeout)
+            if res.status == 415:
+                _logger.info("compressed requests not supported, "
+                             "sending them uncompressed")
+                self._gzip_upload = False
+                res = None
+        if res is None:
+            res = self._http.request("POST", _url, body=body,
+                                     headers=_headers, timeout=_timeout)
+        if res.status // 100 != 2:
+            _logger.error(res.data.decode("utf-8", errors="replace"))
+            raise HTTPError(f"{res.status} error for url: {_url}")
         return res
 
     def set_metric(self, metric):
@@ -142,7 +298,7 @@ class QsimovCloudClient(object):
         """
         if not isinstance(metric, str) or metric == "":
             raise ValueError("metric has to be a non-empty string")
-        self._data["metric"] = metric
+        self._set_data("metric", metric)
 
     def set_ancilla_mode(self, ancilla_mode):
         """Set the mode for ancilla qubits.
@@ -160,7 +316,7 @@ class QsimovCloudClient(object):
         """
         if ancilla_mode not in _ancilla_modes:
             raise ValueError("invalid ancilla mode")
-        self._data["ancilla_mode"] = ancilla_mode
+        self._set_data("ancilla_mode", ancilla_mode)
 
     def set_qasm_version(self, qasm_version):
         """Set the version of the QASM (Quantum Assembly) language.
@@ -175,7 +331,7 @@ class QsimovCloudClient(object):
         """
         if qasm_version != "2.0" and qasm_version != "3.0":
             raise ValueError("invalid QASM version")
-        self._data["qasm_version"] = qasm_version
+        self._set_data("qasm_version", qasm_version)
 
     def set_state(self, state_bin=None, num_qubits=None, state=None):
         """Set the reference quantum state for the computation.
@@ -192,24 +348,26 @@ class QsimovCloudClient(object):
             if num_qubits is None or state is None:
                 raise ValueError("either state_bin or num_qubits and state "
                                  "have to be specified")
-            if state < 0 or state >= 2**num_qubits:
+            if not isinstance(state, int):
+                raise ValueError("state has to be an integer")
+            if state < 0 or state.bit_length() > num_qubits:
                 raise ValueError("the state is out of range")
             if self._data["state_bin"] is not None:
                 _logger.info("state bin info overwritten")
-            self._data["n_qubits"] = num_qubits
-            self._data["state"] = state
-            self._data["state_bin"] = None
+            self._set_data("n_qubits", num_qubits)
+            self._set_data("state", state)
+            self._set_data("state_bin", None)
         else:
-            if not isinstance(state_bin, str) or _bin_regex.match(state_bin) is None:
+            if not isinstance(state_bin, str) or not _is_bin(state_bin):
                 raise ValueError("state_bin is not a string of bits")
             if num_qubits is not None or state is not None:
                 print("[WARNING] num_qubits and state parameter will be "
                       "ignored since state_bin has been specified")
             if self._data["n_qubits"] is not None:
                 _logger.info("state and num_qubits info overwritten")
-            self._data["n_qubits"] = None
-            self._data["state"] = None
-            self._data["state_bin"] = state_bin
+            self._set_data("n_qubits", None)
+            self._set_data("state", None)
+            self._set_data("state_bin", state_bin)
 
     def can_have_nan(self, value):
         """Specify whether NaN (0/0) values are inclided in the superposition.
@@ -222,7 +380,7 @@ class QsimovCloudClient(object):
         """
         if not isinstance(value, bool):
             raise ValueError("expected a boolean value")
-        self._data["with_nan"] = value
+        self._set_data("with_nan", value)
 
     def set_range(self, distance_range):
         """Set the range of distances/similarities for the superposition.
@@ -236,13 +394,14 @@ class QsimovCloudClient(object):
         """
         min_range = parse_number(distance_range[0])
         max_range = parse_number(distance_range[1])
-        if min_range != sp.nan and max_range != sp.nan and min_range > max_range:
+        if min_range is not _NAN and max_range is not _NAN and min_range > max_range:
             raise ValueError("min_range is greater than max_range")
         if self._data["distances"] is not None:
             _logger.info("distances info overwritten")
-        self._data["distances"] = None
-        self._data["min_range"] = min_range
-        self._data["max_range"] = max_range
+        self._set_data("distances", None)
+        self._set_data("distances_str", None)
+        self._set_data("min_range", min_range)
+        self._set_data("max_range", max_range)
 
     def set_distances(self, distances):
         """Set the specific distances for the superposition.
@@ -258,9 +417,10 @@ class QsimovCloudClient(object):
             raise ValueError("expected a list")
         if self._data["min_range"] is not None:
             _logger.info("range info overwritten")
-        self._data["distances"] = tuple([parse_number(i) for i in distances])
-        self._data["min_range"] = None
-        self._data["max_range"] = None
+        self._set_data("distances", tuple(parse_number(i) for i in distances))
+        self._set_data("distances_str", tuple(map(str, self._data["distances"])))
+        self._set_data("min_range", None)
+        self._set_data("max_range", None)
 
     def calculate_extra_qubits(self):
         """Calculate the extra qubits needed for the superposition.
@@ -289,12 +449,17 @@ class QsimovCloudClient(object):
         res = self._send_request("circuit_service")
         if res["qasm_circuit"].startswith('https'):
             try:
-                circuit = requests.get(url).text
+                download = self._http.request("GET", res["qasm_circuit"],
+                                              timeout=_timeout)
+                if download.status // 100 != 2:
+                    raise HTTPError(f"{download.status} error for url: "
+                                    f"{res['qasm_circuit']}")
+                circuit = download.data.decode("utf-8")
             except Exception:
                 print("Unable to generate the circuit")
-                _logger.error(res.json())
+                _logger.error(res)
                 return None
-            res["qasm_circuit"] = circuit
+            res = {**res, "qasm_circuit": circuit}
         return SuperpositionCircuit(self._data, res)
 
     def calculate_num_superposed(self):
@@ -306,12 +471,34 @@ class QsimovCloudClient(object):
         data = self._send_request("total_states_superposed_service")
         return data["total_states_superposed"]
 
+    def calculate_all(self):
+        """Calculate the extra qubits, the distance range and the number of superposed states concurrently.
+
+        The three requests are independent, so they are sent in parallel through the shared connection pool.
+        The client configuration must not be modified until this method returns.
+
+        Returns:
+            dict: A dictionary with the keys 'extra_qubits', 'distance_range' and 'num_superposed'.
+        """
+        jobs = {"extra_qubits": self.calculate_extra_qubits,
+                "distance_range": self.calculate_distance_range,
+                "num_superposed": self.calculate_num_superposed}
+        with ThreadPoolExecutor(max_workers=len(jobs)) as executor:
+            futures = {key: executor.submit(job) for key, job in jobs.items()}
+            return {key: future.result() for key, future in futures.items()}
+
 
 class SuperpositionCircuit(object):
     """Represents a superposition circuit generated by the Qsimov cloud service.
 
     This class provides access to various properties and information about the
     generated superposition circuit."""
+
+    __slots__ = ("_metric", "_n_qubits", "_state", "_bin", "_distances",
+                 "_min_range", "_max_range", "_with_nan", "_qasm_version",
+                 "_ancilla_mode", "_qasm", "_extra_qubits",
+                 "_total_states_superposed")
+
     def __init__(self, data, res):
         """
         Initialize the SuperpositionCircuit with the data received.
@@ -326,7 +513,7 @@ class SuperpositionCircuit(object):
         self._state = data["state"]
         self._bin = data["state_bin"]
         if self._bin is None:
-            self._bin = ("{:0" + str(self._n_qubits) + "b}").format(self._state)
+            self._bin = format(self._state, f"0{self._n_qubits}b")
         else:
             self._n_qubits = len(self._bin)
             self._state = int(self._bin, 2)
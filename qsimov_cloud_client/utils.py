@@ -1,23 +1,46 @@
 # -*- coding: utf-8 -*-
+import functools
+import itertools
 import sympy as sp
 
+from fractions import Fraction
+
+
+_NAN = sp.Rational(0, 0)
+_INF = float('inf')
+# Every capitalization of "nan" and "inf", so parsing needs no lower() call.
+_NAN_STRS = frozenset(map("".join, itertools.product("nN", "aA", "nN"))) | {"0/0"}
+_INF_STRS = frozenset(map("".join, itertools.product("iI", "nN", "fF")))
+
 
 def parse_number(number):
-    """Parse a string representation of a number into a Sympy Rational number or a float infinite number.
+    """Parse a string representation of a number into a Fraction, a float infinite number or Sympy's NaN.
 
     Args:
         number (str): The string representation of the number to be parsed.
 
     Returns:
-        Union[sp.Rational, float]: The parsed numerical value.
+        Union[Fraction, float, sp.Rational]: The parsed numerical value.
 
     Raises:
         ValueError: If the input is not a valid number representation.
     """
-    number = str(number)
-    if number.lower() == "nan" or number == "0/0":
-        return sp.Rational(0, 0)
-    elif number.lower() == "inf":
-        return float('inf')
+    return _parse_number_cached(str(number))
+
+
+@functools.lru_cache(maxsize=4096)
+def _parse_number_cached(number):
+    """Memoized implementation of parse_number, keyed on the string representation.
+
+    Args:
+        number (str): The string representation of the number to be parsed.
+
+    Returns:
+        Union[Fraction, float, sp.Rational]: The parsed numerical value.
+    """
+    if number in _NAN_STRS:
+        return _NAN
+    elif number in _INF_STRS:
+        return _INF
     else:
-        return sp.Rational(number)
\ No newline at end of file
+        return Fraction(number)
\ No newline at end of file
@@ -1,3 +1,4 @@
+import gzip
 import logging
 import qsimov_cloud_client as qcc
 import random as rnd
@@ -7,9 +8,10 @@ import json
 import jsonschema
 import os
 
+from fractions import Fraction
 from jsonschema import validate
-from unittest import TestCase, main, mock
-from requests.exceptions import HTTPError
+from unittest import TestCase, main, mock, skipIf
+from urllib3.exceptions import HTTPError, ReadTimeoutError
 
 
 _valid_chars = string.ascii_lowercase + string.digits
@@ -33,19 +35,19 @@ with open(os.path.join(schemas_path, "response_circuit_service.json")) as f:
 
 def mocked_requests_post(*args, **kwargs):
     class MockResponse:
-        def __init__(self, json_data, status_code):
+        def __init__(self, json_data, status):
             self.json_data = json_data
-            self.status_code = status_code
+            self.status = status
 
-        def raise_for_status(self):
-            if self.status_code // 100 != 2:
-                raise HTTPError(self.status_code)
+        @property
+        def data(self):
+            return json.dumps(self.json_data).encode("utf-8")
 
-        def json(self):
-            return self.json_data
-
-    if args[0] == 'https://qcaas.qsimov.com/superpositions':
-        data = kwargs["json"]
+    if args[0] == "POST" and args[1] == 'https://qcaas.qsimov.com/superpositions':
+        body = kwargs["body"]
+        if kwargs["headers"].get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        data = json.loads(body)
         validate(instance=data, schema=request_schema)
         res = responses[data["service"]]
         res["params"] = data
@@ -66,6 +68,7 @@ class TestCloudMethods(TestCase):
         self.assertIsNone(self.cli._data["state"])
         self.assertIsNone(self.cli._data["state_bin"])
         self.assertIsNone(self.cli._data["distances"])
+        self.assertIsNone(self.cli._data["distances_str"])
         self.assertIsNone(self.cli._data["min_range"])
         self.assertIsNone(self.cli._data["max_range"])
         self.assertIsNone(self.cli._data["with_nan"])
@@ -141,6 +144,13 @@ class TestCloudMethods(TestCase):
                 self.cli.set_state(num_qubits=i, state=-1)
             with self.assertRaises(ValueError):
                 self.cli.set_state(num_qubits=i, state=sta+1)
+            with self.assertRaises(ValueError):
+                self.cli.set_state(num_qubits=i, state=float(sta))
+        for state_bin in ["", "0120", "01\n", "1" * 70 + "2", "0" * 70 + "\n"]:
+            with self.assertRaises(ValueError):
+                self.cli.set_state(state_bin=state_bin)
+        self.cli.set_state(state_bin="10" * 40)
+        self.assertEqual(self.cli._data["state_bin"], "10" * 40)
         with self.assertRaises(ValueError):
             self.cli.set_state(state_bin=None, num_qubits=None, state=None)
         with self.assertRaises(ValueError):
@@ -186,6 +196,7 @@ class TestCloudMethods(TestCase):
         with self.assertLogs(_logger, level=logging.INFO) as cm:
             self.cli.set_distances(d)
             self.assertEqual(cm.output, ['INFO:QsimovCloudClient:range info overwritten'])
+        self.assertEqual(self.cli._data["distances_str"], tuple(str(i) for i in self.cli._data["distances"]))
         self.assertIsNone(self.cli._data["min_range"])
         self.assertIsNone(self.cli._data["max_range"])
         self.assertEqual([float(self.cli._data["distances"][i]) if i % 3 != 0
@@ -215,7 +226,7 @@ class TestCloudMethods(TestCase):
         with self.assertRaises(TypeError):
             self.cli.set_distances()
 
-    @mock.patch("qsimov_cloud_client.requests.Session.post", side_effect=mocked_requests_post)
+    @mock.patch("qsimov_cloud_client.urllib3.PoolManager.request", side_effect=mocked_requests_post)
     def test_requests(self, mock_post):
         self.cli.set_metric("ample")
         self.cli.set_state(state_bin="0110")
@@ -231,6 +242,197 @@ class TestCloudMethods(TestCase):
         ns = self.cli.calculate_num_superposed()
         ex = self.cli.calculate_extra_qubits()
         sc2 = self.cli.generate_circuit()
+        self.assertIsInstance(sc2, qcc.SuperpositionCircuit)
+        self.assertEqual(sc2.get_state(), (3, 4))
+        self.assertEqual(sc2.get_state_bin(), "100")
+        self.assertTrue(sc2.is_nan_allowed())
+        self.assertEqual(sc2.get_qasm_code(), responses["circuit_service"]["response"]["qasm_circuit"])
+
+    @mock.patch("qsimov_cloud_client.urllib3.PoolManager.request", side_effect=mocked_requests_post)
+    def test_request_body(self, mock_post):
+        self.cli.set_metric("ample")
+        self.cli.set_state(state_bin="0110")
+        r = self.cli.calculate_distance_range()
+        self.assertEqual(r, (responses["distances_range_service"]["response"]["distances_range_min"],
+                             responses["distances_range_service"]["response"]["distances_range_max"]))
+        body = json.loads(mock_post.call_args.kwargs["body"])
+        self.assertNotIn("body", body)
+        self.assertEqual(body["service"], "distances_range_service")
+        self.assertEqual(body["state_bin"], "0110")
+
+    @mock.patch("qsimov_cloud_client.urllib3.PoolManager.request", side_effect=mocked_requests_post)
+    def test_calculate_all(self, mock_post):
+        self.cli.set_metric("ample")
+        self.cli.set_state(state=4, num_qubits=3)
+        self.cli.set_distances(["0", "1/2", "inf"])
+        self.cli.can_have_nan(False)
+        res = self.cli.calculate_all()
+        self.assertEqual(res, {"extra_qubits": self.cli.calculate_extra_qubits(),
+                               "distance_range": self.cli.calculate_distance_range(),
+                               "num_superposed": self.cli.calculate_num_superposed()})
+        self.assertEqual(mock_post.call_count, 3)
+
+    @mock.patch("qsimov_cloud_client.urllib3.PoolManager.request", side_effect=mocked_requests_post)
+    def test_cache(self, mock_post):
+        self.cli.set_metric("ample")
+        self.cli.set_state(state_bin="0110")
+        self.cli.calculate_distance_range()
+        self.cli.calculate_distance_range()
+        self.assertEqual(mock_post.call_count, 1)
+        self.cli.set_state(state_bin="0111")
+        self.cli.calculate_distance_range()
+        self.assertEqual(mock_post.call_count, 2)
+        self.cli.set_state(state_bin="0110")
+        self.cli.calculate_distance_range()
+        self.assertEqual(mock_post.call_count, 2)
+        self.cli.clear_cache()
+        self.cli.calculate_distance_range()
+        self.assertEqual(mock_post.call_count, 3)
+
+    @mock.patch("qsimov_cloud_client.urllib3.PoolManager.request", side_effect=mocked_requests_post)
+    def test_cache_size(self, mock_post):
+        self.cli.set_metric("ample")
+        n_states = qcc.client._cache_size + 8
+        for state in range(n_states):
+            self.cli.set_state(num_qubits=8, state=state)
+            self.cli.calculate_distance_range()
+            self.cli.set_state(num_qubits=8, state=0)
+            self.cli.calculate_distance_range()
+        self.assertEqual(len(self.cli._cache), qcc.client._cache_size)
+        self.assertEqual(mock_post.call_count, n_states)
+        self.cli.set_state(num_qubits=8, state=1)
+        self.cli.calculate_distance_range()
+        self.assertEqual(mock_post.call_count, n_states + 1)
+
+    @mock.patch("qsimov_cloud_client.urllib3.PoolManager.request", side_effect=mocked_requests_post)
+    def test_http_error(self, mock_post):
+        self.cli.set_metric("ample")
+        self.cli.set_state(state_bin="0110")
+        with mock.patch("qsimov_cloud_client.client._url", "https://qcaas.qsimov.com/unknown"):
+            with self.assertLogs(_logger, level=logging.ERROR):
+                with self.assertRaises(HTTPError):
+                    self.cli.calculate_distance_range()
+
+    @mock.patch("qsimov_cloud_client.urllib3.PoolManager.request", side_effect=mocked_requests_post)
+    def test_gzip_upload(self, mock_post):
+        self.cli.set_metric("ample")
+        self.cli.set_state(state_bin="0110")
+        self.cli.can_have_nan(False)
+        self.cli.set_distances([str(i) for i in range(500)])
+        self.cli.calculate_extra_qubits()
+        self.assertEqual(mock_post.call_args.kwargs["headers"]["Content-Encoding"], "gzip")
+        self.assertEqual(json.loads(gzip.decompress(mock_post.call_args.kwargs["body"]))["distances"],
+                         [str(i) for i in range(500)])
+        self.cli.set_distances(["0", "1"])
+        self.cli.calculate_extra_qubits()
+        self.assertNotIn("Content-Encoding", mock_post.call_args.kwargs["headers"])
+
+    def test_gzip_unsupported(self):
+        def mocked_no_gzip(*args, **kwargs):
+            if "Content-Encoding" in kwargs["headers"]:
+                res = mock.Mock()
+                res.status = 415
+                return res
+            return mocked_requests_post(*args, **kwargs)
+
+        self.cli.set_metric("ample")
+        self.cli.set_state(state_bin="0110")
+        self.cli.can_have_nan(False)
+        self.cli.set_distances([str(i) for i in range(500)])
+        with mock.patch("qsimov_cloud_client.urllib3.PoolManager.request", side_effect=mocked_no_gzip) as mock_post:
+            with self.assertLogs(_logger, level=logging.INFO):
+                self.cli.calculate_extra_qubits()
+            self.assertEqual(mock_post.call_count, 2)
+            self.assertFalse(self.cli._gzip_upload)
+            self.cli.calculate_num_superposed()
+            self.assertEqual(mock_post.call_count, 3)
+
+    @mock.patch("qsimov_cloud_client.urllib3.PoolManager.request", side_effect=mocked_requests_post)
+    def test_range_body(self, mock_post):
+        self.cli.set_metric("ample")
+        self.cli.set_state(state_bin="0110")
+        self.cli.can_have_nan(True)
+        for distance_range in [("1/3", "inf"), ("nan", "3/2"), ("0", 2)]:
+            self.cli.set_range(distance_range)
+            self.cli.calculate_extra_qubits()
+            body = json.loads(mock_post.call_args.kwargs["body"])
+            self.assertEqual((body["min_range"], body["max_range"]),
+                             tuple(str(d) for d in distance_range))
+        with self.assertRaises(TypeError):
+            qcc.client._dumps({"state": object()})
+
+    def test_dumps(self):
+        values = {"state": 2**70, "n_qubits": 80, "min_range": Fraction(1, 3)}
+        dumpers = [qcc.client._json_dumps, qcc.client._dumps]
+        for dumps in dumpers:
+            self.assertEqual(json.loads(dumps(values)),
+                             {"state": 2**70, "n_qubits": 80, "min_range": "1/3"})
+            with self.assertRaises(TypeError):
+                dumps({"state": object()})
+
+    @skipIf(qcc.client.orjson is None, "orjson is not installed")
+    def test_dumps_orjson(self):
+        self.assertEqual(qcc.client._dumps({"state": 5}), qcc.client.orjson.dumps({"state": 5}))
+        self.assertEqual(json.loads(qcc.client._dumps({"state": 2**64})), {"state": 2**64})
+
+    @mock.patch("qsimov_cloud_client.urllib3.PoolManager.request", side_effect=mocked_requests_post)
+    def test_large_state(self, mock_post):
+        self.cli.set_metric("ample")
+        self.cli.set_state(num_qubits=80, state=2**70)
+        for dumps in [qcc.client._json_dumps, qcc.client._dumps]:
+            self.cli.clear_cache()
+            with mock.patch("qsimov_cloud_client.client._dumps", dumps):
+                self.cli.calculate_distance_range()
+            self.assertEqual(json.loads(mock_post.call_args.kwargs["body"])["state"], 2**70)
+
+    def test_circuit_url(self):
+        url = "https://bucket.s3.amazonaws.com/circuit.qasm?X-Amz-Expires=60"
+        qasm = responses["circuit_service"]["response"]["qasm_circuit"]
+        get_status = [403]
+
+        def mocked_url_request(*args, **kwargs):
+            if args[0] == "GET":
+                res = mock.Mock()
+                res.status = get_status[0]
+                res.data = (b"<Error>Request has expired</Error>" if get_status[0] != 200
+                            else qasm.encode("utf-8"))
+                return res
+            res = mocked_requests_post(*args, **kwargs)
+            payload = json.loads(res.data)
+            payload["response"] = {**payload["response"], "qasm_circuit": url}
+            res.json_data = payload
+            return res
+
+        self.cli.set_metric("ample")
+        self.cli.set_state(state_bin="0110")
+        self.cli.set_distances(["0", "1"])
+        self.cli.can_have_nan(False)
+        with mock.patch("qsimov_cloud_client.urllib3.PoolManager.request", side_effect=mocked_url_request) as mock_req:
+            with self.assertLogs(_logger, level=logging.ERROR):
+                self.assertIsNone(self.cli.generate_circuit())
+            get_status[0] = 200
+            sc = self.cli.generate_circuit()
+            self.assertEqual(sc.get_qasm_code(), qasm)
+            methods = [c.args[0] for c in mock_req.call_args_list]
+            self.assertEqual(methods, ["POST", "GET", "POST", "GET"])
+            self.assertFalse(self.cli._cache)
+
+    def test_retries(self):
+        retries = self.cli._http.connection_pool_kw["retries"]
+        self.assertEqual(retries.total, 5)
+        self.assertTrue(retries.is_retry("POST", 503))
+        self.assertFalse(retries.is_retry("POST", 400))
+        with self.assertRaises(ReadTimeoutError):
+            retries.increment("POST", "https://qcaas.qsimov.com/superpositions",
+                              error=ReadTimeoutError(None, "https://qcaas.qsimov.com/superpositions", "timed out"))
+
+    def test_close(self):
+        with mock.patch("qsimov_cloud_client.urllib3.PoolManager.clear") as mock_close:
+            with qcc.QsimovCloudClient(self.token) as cli:
+                self.assertIsInstance(cli, qcc.QsimovCloudClient)
+            mock_close.assert_called_once()
+            self.cli.close()
+            self.assertEqual(mock_close.call_count, 2)
 
 if __name__ == '__main__':
     main()